@@ -1,12 +1,28 @@
 """Parse config files."""
 from misc import read_input_csv as ricsv
-from copy import deepcopy
+import mmap
+import os
 from input_output.organize import Organize_input
 import tomli
 import tomli_w
 import yaml
 from yaml.loader import FullLoader
 import numpy as np
+import re
+
+# Tokens that float() will accept (including inf, nan and underscores between digits, e.g., 1_000)
+_FLOAT_RE = re.compile(r'^[+-]?((\d(_?\d)*\.?(\d(_?\d)*)?|\.\d(_?\d)*)([eE][+-]?\d(_?\d)*)?|inf(inity)?|nan)$',
+                       re.IGNORECASE)
+
+# Headers of the parts in .pipt/.popt files
+_HDRS = {'dataassim', 'optim', 'fwdsim'}
+
+# Init. files of at least this size (in bytes) are memory-mapped when read
+_MMAP_MIN_SIZE = 1 << 20
+
+# Parsed keywords from read_txt, keyed by absolute path of the init. file. The entries are
+# (modification time, size, keywords), and are replaced when the file changes
+_PARSE_CACHE = {}
 
 
 def convert_txt_to_yaml(init_file):
@@ -146,49 +162,109 @@ def read_txt(init_file):
         raise FileNotFoundError(f'No PIPT or POPT input file (.pipt or .popt) found! If {init_file} is  '
                                 f'a PIPT or POPT input file, change suffix to .pipt or .popt')
 
-    # Read the init file and output lines without comments (lines starting with '#')
-    lines = read_clean_file(init_file)
-
-    # Find where the separate parts are located in the file. FWDSIM will always be a part, but the
-    # inversion/optimiztation part may be DATAASSIM or OPTIM
-    prind = None
-    pr_part = None
-    fwdsimind = None
-    for i in range(len(lines)):
-        if lines[i].strip().lower() == 'dataassim' or lines[i].strip().lower() == 'optim':
-            prind = i
-            pr_part = lines[i].strip().lower()
-        elif lines[i].strip().lower() == 'fwdsim':
-            fwdsimind = i
-
-    # Split the file into the two separate parts. Each part will (only) contain the keywords of each part:
-    if prind < fwdsimind:  # Data assim. part is the first part of file
-        lines_pr = lines[2:fwdsimind]
-        lines_fwd = lines[fwdsimind + 2:]
-    else:  # Fwd sim. part is the first part of file
-        lines_fwd = lines[2:prind]
-        lines_pr = lines[prind + 2:]
-
-    # Get rid of empty lines in lines_pr and lines_fwd
-    clean_lines_pr = remove_empty_lines(lines_pr)
-    clean_lines_fwd = remove_empty_lines(lines_fwd)
+    # Reuse the keywords if the same (unchanged) file has been parsed before. Organize_input modifies the
+    # dictionaries, hence we only hand out copies of the cached ones
+    st = os.stat(init_file)
+    path = os.path.abspath(init_file)
+    cached = _PARSE_CACHE.get(path)
+    if cached is None or cached[:2] != (st.st_mtime_ns, st.st_size):  # Not parsed, or changed since; (re)parse
+        cached = (st.st_mtime_ns, st.st_size, _parse_txt(init_file))
+        _PARSE_CACHE[path] = cached
+    keys_pr, keys_fwd = (_clone_keys(keys) for keys in cached[2])
+
+    org = Organize_input(keys_pr, keys_fwd)
+    org.organize()
+
+    return org.get_keys_pr(), org.get_keys_fwd()
+
+
+def _parse_txt(init_file):
+    """
+    Parse the keywords in a PIPT or POPT input file, and check for mandatory keywords.
+
+    Parameters
+    ----------
+    init_file : str
+        PIPT or POPT init. file
+
+    Returns
+    -------
+    keys_pr : dict
+        Parsed keywords from DATAASSIM or OPTIM
+    keys_fwd : dict
+        Parsed keywords from FWDSIM
+    """
+    # Read the init file and collect the keyword blocks of each part. FWDSIM will always be a part, but the
+    # inversion/optimization part may be DATAASSIM or OPTIM
+    sections = dict(_iter_sections(init_file))
+    if 'dataassim' in sections and 'optim' in sections:
+        raise ValueError(f'Both DATAASSIM and OPTIM found in {init_file}!')
+    if 'fwdsim' not in sections:
+        raise ValueError(f'FWDSIM not found in {init_file}!')
 
     # Assign the keys and values to different dictionaries depending on whether we have data assimilation (DATAASSIM)
     # or optimization (OPTIM). FWDSIM info is always assigned to keys_fwd
-    keys_pr = None
-    if pr_part == 'dataassim':
-        keys_pr = parse_keywords(clean_lines_pr)
+    if 'dataassim' in sections:
+        keys_pr = parse_keywords(sections['dataassim'])
         check_mand_keywords_da(keys_pr)
-    elif pr_part == 'optim':
-        keys_pr = parse_keywords(clean_lines_pr)
+    elif 'optim' in sections:
+        keys_pr = parse_keywords(sections['optim'])
         check_mand_keywords_opt(keys_pr)
-    keys_fwd = parse_keywords(clean_lines_fwd)
+    else:
+        raise ValueError(f'Neither DATAASSIM nor OPTIM found in {init_file}!')
+    keys_fwd = parse_keywords(sections['fwdsim'])
     check_mand_keywords_fwd(keys_fwd)
 
-    org = Organize_input(keys_pr, keys_fwd)
-    org.organize()
+    return keys_pr, keys_fwd
 
-    return org.get_keys_pr(), org.get_keys_fwd()
+
+def _clone_keys(keys):
+    """
+    Copy a dictionary from `parse_keywords`. The values are floats, strings or (nested) lists of these, hence only
+    the lists need to be copied. This is much faster than `deepcopy` for these dictionaries.
+    """
+    return {key: _clone_list(val) if type(val) is list else val for key, val in keys.items()}
+
+
+def _clone_list(val):
+    """Copy a (nested) list of floats and strings."""
+    return [_clone_list(x) if type(x) is list else x for x in val]
+
+
+def _iter_sections(init_file):
+    """
+    Read PIPT/POPT init. file and yield the keyword blocks of each part (DATAASSIM, OPTIM or FWDSIM). The file is
+    read as for `read_clean_file` and split into keyword blocks one at a time (as by `remove_empty_lines`), and a
+    part header starts a new block. The blocks of a part are collected before the part is yielded.
+
+    Parameters
+    ----------
+    init_file : str
+        Name of init. file. WHOLE filename needed (with suffix!)
+
+    Yields
+    ------
+    part : str
+        Name of the part in lower case
+    blocks : list
+        Keyword blocks in the part, each a list of lines
+    """
+    current = None
+    blocks = []
+    for block in _iter_blocks(_iter_clean_lines(init_file)):
+        part = block[0].strip().lower()  # Only the first line of a block can be a part header
+        if part in _HDRS:  # New part; flush the previous one
+            if current is not None:
+                yield current, blocks
+            current = part
+            blocks = []
+            block = block[1:]  # Keywords may follow the header without an empty line in between
+        if block:
+            blocks.append(block)
+
+    # Flush the last part
+    if current is not None:
+        yield current, blocks
 
 
 def read_clean_file(init_file):
@@ -203,16 +279,62 @@ def read_clean_file(init_file):
     Returns
     -------
     lines : list
-        Lines from init. file converted to list entries
+        Lines from init. file converted to list entries (without line endings)
     """
     # Read file except lines starting with an octothorpe (#) and return the python variable
-    with open(init_file, 'r') as f:
-        lines = [line for line in f.readlines() if not line.startswith('#')]
+    lines = list(_iter_clean_lines(init_file))
 
     # Return clean lines
     return lines
 
 
+def _iter_clean_lines(init_file):
+    """
+    Return the lines of PIPT init. file that are not comments, without line endings. Small files are read as a
+    list from the buffered text file, while large files are memory-mapped and streamed, so that comment lines are
+    skipped without being decoded.
+
+    Parameters
+    ----------
+    init_file : str
+        Name of init. file. WHOLE filename needed (with suffix!)
+
+    Returns
+    -------
+    lines : iterable
+        Lines from init. file
+    """
+    if os.stat(init_file).st_size < _MMAP_MIN_SIZE:
+        # Iterate the buffered text file, which splits the lines (universal newlines) in C
+        with open(init_file, 'r', encoding='utf-8', buffering=1 << 16) as f:
+            return [line.rstrip('\n') for line in f if not line.startswith('#')]
+    return _iter_mapped_lines(init_file)
+
+
+def _iter_mapped_lines(init_file):
+    """
+    Memory-map init. file and yield the lines that are not comments, without line endings.
+    """
+    with open(init_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from _decode_lines(iter(mm.readline, b''))
+
+
+def _decode_lines(raw_lines):
+    """
+    Split the raw lines at line breaks as in text mode (line feed, carriage return and line feed, or a lone
+    carriage return), and decode (UTF-8) the lines that are not comments, without line endings. Both ways of
+    reading in `_iter_clean_lines` give the same lines as reading the file in text mode.
+    """
+    for raw in raw_lines:
+        if raw.endswith(b'\n'):
+            raw = raw[:-1]
+        if raw.endswith(b'\r'):  # Carriage return and line feed (or a lone carriage return at the end)
+            raw = raw[:-1]
+        for line in raw.split(b'\r'):  # A lone carriage return is also a line break
+            if not line.startswith(b'#'):
+                yield line.decode('utf-8')
+
+
 def remove_empty_lines(lines):
     """
     Small method for finding empty lines in a read file.
@@ -220,31 +342,37 @@ def remove_empty_lines(lines):
     Parameters
     ----------
     lines : list
-        List of lines from a file
+        List (or iterable) of lines from a file, without line endings (as from `read_clean_file`)
 
     Returns
     -------
     lines_clean : list
         List of clean lines (without empty entries)
     """
-    # Loop over lines to find '\n'
-    sep = []
-    for i in range(len(lines)):
-        if lines[i] == '\n':
-            sep.append(i)
-
-    # Make clean output
-    lines_clean = []
-    for i in range(len(sep)):
-        if i == 0:
-            lines_clean.append(lines[0:sep[i]])
-        else:
-            lines_clean.append(lines[sep[i-1] + 1:sep[i]])
+    # Split the lines into blocks at the empty lines
+    lines_clean = list(_iter_blocks(lines))
 
     # Return
     return lines_clean
 
 
+def _iter_blocks(lines):
+    """
+    Yield the blocks of consecutive lines that are not empty (see `remove_empty_lines`), one at a time.
+    """
+    block = []
+    for line in lines:
+        if line:
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+
+    # The last block need not end with an empty line
+    if block:
+        yield block
+
+
 def parse_keywords(lines):
     """
     Here we parse the lines in the init. file to a Python dictionary. The keys of the dictionary is the keywords
@@ -261,87 +389,90 @@ def parse_keywords(lines):
     -------
     keys : dict
         Dictionary with all info. from the init. file.
+
+    !!! note
+        Multiple values are stored as (nested) lists, not tuples. The lists are modified in place by
+        `Organize_input` and the PIPT/POPT classes, and many of these check for `list` explicitly.
     """
     # Init. the dictionary
     keys = {}
+    mixed_keys = set()
 
     # Loop over all input keywords and store in the dictionary.
-    for i in range(len(lines)):
-        if lines[i] != []:  # Check for empty list (corresponds to empty line in file)
-            try:  # Try first to store the info. in keyword as float in a 1D list
-                # A scalar, which we store as scalar...
-                if len(lines[i][1:]) == 1 and len(lines[i][1:][0].split()) == 1:
-                    keys[lines[i][0].strip().lower()] = float(lines[i][1:][0])
-                else:
-                    keys[lines[i][0].strip().lower()] = [float(x) for x in lines[i][1:]]
-            except:
-                try:  # Store as float in 2D list
-                    if len(lines[i][1:]) == 1:  # Check if it is actually a 1D array disguised as 2D
-                        keys[lines[i][0].strip().lower()] = \
-                            [float(x) for x in lines[i][1:][0].split()]
-                    else:  # if not store as 2D list
-                        keys[lines[i][0].strip().lower()] = \
-                            [[float(x) for x in col.split()] for col in lines[i][1:]]
-                except:  # Keyword contains string(s), not floats
-                    if len(lines[i][1:]) == 1:  # If 1D list
-                        # If it is a scalar store as single input
-                        if len(lines[i][1:][0].split('\t')) == 1:
-                            keys[lines[i][0].strip().lower()] = lines[i][1:][0].strip().lower()
-                        else:  # Store as 1D list
-                            keys[lines[i][0].strip().lower()] = \
-                                [x.rstrip('\n').lower()
-                                 for x in lines[i][1:][0].split('\t') if x != '']
-                    else:  # It is a 2D list
-                        # Check each row in 2D list. If it is single column (i.e., one string per row),
-                        # we make it a 1D list of strings; if not, we make it a 2D list of strings.
-                        one_col = True
-                        for j in range(len(lines[i][1:])):
-                            if len(lines[i][1:][j].split('\t')) > 1:
-                                one_col = False
-                                break
-                        if one_col is True:  # Only one column
-                            keys[lines[i][0].strip().lower()] = \
-                                [x.rstrip('\n').lower() for x in lines[i][1:]]
-                        else:  # Store as 2D list
-                            keys[lines[i][0].strip().lower()] = \
-                                [[x.rstrip('\n').lower() for x in col.split('\t') if x != '']
-                                    for col in lines[i][1:]]
+    for entry in lines:
+        if entry == []:  # Check for empty list (corresponds to empty line in file)
+            continue
+        key = entry[0].strip().lower()
+        body = entry[1:]
+        n = len(body)
+        body0 = body[0] if body else ''
+
+        # Convert all tokens at once. Only keywords with strings fail, which costs a single exception per keyword
+        try:
+            values = [[float(x) for x in row.split()] for row in body]
+        except ValueError:
+            values = None
+        if values is not None:  # Keyword contains floats only
+            mixed_keys.discard(key)  # In case the keyword was given before
+            if all(len(row) == 1 for row in values):  # One value per row
+                if n == 1:  # A scalar, which we store as scalar...
+                    keys[key] = values[0][0]
+                else:  # ... or as 1D list
+                    keys[key] = [row[0] for row in values]
+            elif n == 1:  # 1D array written on a single row
+                keys[key] = values[0]
+            else:  # if not store as 2D list
+                keys[key] = values
+        else:  # Keyword contains string(s), not floats
+            if any(_classify(x) for row in body for x in row.split()):  # Some entries may be floats; handled below
+                mixed_keys.add(key)
+            if n == 1:  # If 1D list
+                # If it is a scalar store as single input
+                if '\t' not in body0:
+                    keys[key] = body0.strip().lower()
+                else:  # Store as 1D list
+                    keys[key] = [x.lower() for x in body0.split('\t') if x != '']
+            else:  # It is a 2D list
+                # Check each row in 2D list. If it is single column (i.e., one string per row),
+                # we make it a 1D list of strings; if not, we make it a 2D list of strings.
+                one_col = not any(row.count('\t') for row in body)
+                if one_col:  # Only one column
+                    keys[key] = [x.lower() for x in body]
+                else:  # Store as 2D list
+                    keys[key] = [[x.lower() for x in col.split('\t') if x != ''] for col in body]
 
     # Need to check if there are any only-string-keywords that actually contains floats, and convert those to
     # floats (the above loop only handles pure float or pure string input, hence we do a quick fix for mixed
-    # lists here)
-    # Loop over all keys in dict. and check every "pure" string keys for floats
-    for i in keys:
-        if isinstance(keys[i], list):  # Check if key is a list
-            if isinstance(keys[i][0], list):  # Check if it is a 2D list
-                for j in range(len(keys[i])):  # Loop over all sublists
-                    # Check sublist for strings
-                    if all(isinstance(x, str) for x in keys[i][j]):
-                        for k in range(len(keys[i][j])):  # Loop over enteries in sublist
-                            try:  # Try to make float
-                                keys[i][j][k] = float(keys[i][j][k])  # Scalar
-                            except:
-                                try:  # 1D array
-                                    keys[i][j][k] = [float(x)
-                                                     for x in keys[i][j][k].split()]
-                                except:  # If it is actually a string, pass over
-                                    pass
-            else:  # It is a 1D list
-                # Check if list only contains strings
-                if all(isinstance(x, str) for x in keys[i]):
-                    for j in range(len(keys[i])):  # Loop over all entries in list
-                        try:  # Try to make float
-                            keys[i][j] = float(keys[i][j])
-                        except:
-                            try:
-                                keys[i][j] = [float(x) for x in keys[i][j].split()]
-                            except:  # If it is actually a string, pass over
-                                pass
+    # lists here). Only the keywords where some token was classified as float need to be checked.
+    for key in mixed_keys:
+        val = keys[key]
+        if type(val) is list:  # A scalar string is left as is
+            if val and type(val[0]) is list:  # 2D list
+                keys[key] = [[_to_float(x) for x in row] for row in val]
+            else:  # 1D list
+                keys[key] = [_to_float(x) for x in val]
 
     # Return dict.
     return keys
 
 
+def _classify(tok):
+    """Return True if the token `tok` can be converted to float."""
+    return _FLOAT_RE.match(tok) is not None
+
+
+def _to_float(entry):
+    """Convert a string entry to float, or 1D list of floats, if all its tokens are floats."""
+    try:  # Scalar
+        return float(entry)
+    except ValueError:
+        pass
+    try:  # 1D array
+        return [float(x) for x in entry.split()]
+    except ValueError:  # If it is actually a string, pass over
+        return entry
+
+
 def check_mand_keywords_fwd(keys_fwd):
     """Check for mandatory keywords in `FWDSIM` part, and output error if they are not present"""
 
@@ -373,9 +504,8 @@ def check_mand_keywords_en(keys_en):
     # Mandatory keywords in ENSEMBLE
     assert 'ne' in keys_en, 'NE not in ENSEMBLE!'
     assert 'state' in keys_en, 'STATE not in ENSEMBLE!'
-    if 'importstaticvar' not in keys_en:
-        assert filter(list(keys_en.keys()),
-                      'prior_*') != [], 'No PRIOR_<STATICVAR> in DATAASSIM'
+    assert 'importstaticvar' in keys_en or any(key.startswith('prior_') for key in keys_en), \
+        'No PRIOR_<STATICVAR> in ENSEMBLE!'
 
 def change_file_extension(filename, new_extension):
     if '.' in filename:
@@ -1,6 +1,25 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from input_output.read_config import read_clean_file, remove_empty_lines, parse_keywords
+from input_output import read_config
+from input_output.read_config import read_clean_file, remove_empty_lines, parse_keywords, check_mand_keywords_en, \
+    read_txt, _iter_sections, _parse_txt
+
+# DATAASSIM and FWDSIM parts of a minimal .pipt file
+DATAASSIM = ('DATAASSIM\n\n'
+             'TRUEDATAINDEX\n1 2\n\n'
+             'ASSIMINDEX\n0 1\n\n'
+             'TRUEDATA\n1\t2\n3\t4\n\n'
+             'DATAVAR\nABS\t1\tABS\t1\n\n'
+             'OBSNAME\nDAYS\n\n'
+             'ENERGY\n98\n\n')
+FWDSIM = ('FWDSIM\n\n'
+          '# Comment\n'
+          'PARALLEL\n1\n\n'
+          'DATATYPE\nA\tB\n\n'
+          'REPORTPOINT\n1 2\n')
 
 
 class TestPiptInit(unittest.TestCase):
@@ -74,3 +93,154 @@ class TestPiptInit(unittest.TestCase):
         # String with whitespaces instead of \t are parsed as single string
         self.assertIsInstance(self.keys['keyword9'], str)
         self.assertEqual(self.keys['keyword9'], 'string1 string2')
+
+    def test_float_with_underscores(self):
+        # Underscores between digits are accepted as by float()
+        self.assertListEqual(self.keys['keyword10'], [1000.0, 2.0])
+
+    def test_remove_empty_lines(self):
+        # Consecutive empty lines give no empty blocks, and a last block without trailing empty line is kept
+        lines = ['KEYWORD1', 'STRING1', '', '', 'KEYWORD2', '1']
+        self.assertListEqual(remove_empty_lines(lines), [['KEYWORD1', 'STRING1'], ['KEYWORD2', '1']])
+
+
+class PiptFileTestCase(unittest.TestCase):
+    """
+    Base class for tests that write .pipt files to a temporary directory.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_pipt(self, text):
+        init_file = os.path.join(self.tmp_dir.name, 'init.pipt')
+        with open(init_file, 'w') as f:
+            f.write(text)
+        return init_file
+
+
+class TestPiptParts(PiptFileTestCase):
+    """
+    Test reading of the DATAASSIM and FWDSIM parts of a .pipt file.
+    """
+
+    def test_part_order(self):
+        # The parts are read the same regardless of their order in the file
+        da_first = _parse_txt(self.write_pipt(DATAASSIM + FWDSIM))
+        fwd_first = _parse_txt(self.write_pipt(FWDSIM + '\n' + DATAASSIM))
+        self.assertEqual(da_first, fwd_first)
+
+        keys_da, keys_fwd = da_first
+        self.assertEqual(keys_da['truedata'], [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(keys_da['datavar'], ['abs', 1.0, 'abs', 1.0])
+        self.assertEqual(keys_da['energy'], 98.0)
+        self.assertEqual(keys_fwd, {'parallel': 1.0, 'datatype': ['a', 'b'], 'reportpoint': [1.0, 2.0]})
+
+    def test_sections_match_list_api(self):
+        # The keyword blocks are the ones given by read_clean_file and remove_empty_lines
+        init_file = self.write_pipt(DATAASSIM + FWDSIM)
+        blocks = remove_empty_lines(read_clean_file(init_file))
+        sections = list(_iter_sections(init_file))
+        self.assertEqual([part for part, _ in sections], ['dataassim', 'fwdsim'])
+        self.assertEqual(sections[0][1] + sections[1][1], [block for block in blocks if len(block) > 1])
+
+    def test_header_without_empty_line(self):
+        # Keywords may follow the part header directly
+        init_file = self.write_pipt(DATAASSIM + FWDSIM.replace('FWDSIM\n\n', 'FWDSIM\n'))
+        self.assertEqual(_parse_txt(init_file)[1]['parallel'], 1.0)
+
+    def test_memory_mapped(self):
+        # Large files are memory-mapped when read, and give the same keywords
+        init_file = self.write_pipt(DATAASSIM + FWDSIM)
+        with mock.patch.object(read_config, '_MMAP_MIN_SIZE', 1), \
+                mock.patch.object(read_config.mmap, 'mmap', wraps=read_config.mmap.mmap) as mapped:
+            keys_mapped = _parse_txt(init_file)
+        self.assertTrue(mapped.called)
+        self.assertEqual(keys_mapped, _parse_txt(init_file))
+
+    def test_missing_or_extra_part(self):
+        # FWDSIM and exactly one of DATAASSIM or OPTIM must be given
+        with self.assertRaises(ValueError):
+            _parse_txt(self.write_pipt(DATAASSIM))
+        with self.assertRaises(ValueError):
+            _parse_txt(self.write_pipt(FWDSIM))
+        with self.assertRaises(ValueError):
+            _parse_txt(self.write_pipt(DATAASSIM + FWDSIM + '\nOPTIM\n\nMAXITER\n10\n'))
+
+
+class TestReadCleanFile(PiptFileTestCase):
+    """
+    Test that small (read through the file buffer) and large (memory-mapped) files give the same lines.
+    """
+
+    def read_both(self, data):
+        # Lines from read_clean_file, read normally and memory-mapped
+        init_file = os.path.join(self.tmp_dir.name, 'init.pipt')
+        with open(init_file, 'wb') as f:
+            f.write(data)
+        lines = read_clean_file(init_file)
+        with mock.patch.object(read_config, '_MMAP_MIN_SIZE', 1):
+            lines_mapped = read_clean_file(init_file)
+        return lines, lines_mapped
+
+    def test_line_splitting(self):
+        # Lines are split on '\n', '\r\n' or a lone '\r' (as in text mode), but not on other characters
+        lines, lines_mapped = self.read_both(b'# Comment\nB\r\n1\x0c2\rC\n\n\xc3\xa6\n')
+        self.assertListEqual(lines, ['B', '1\x0c2', 'C', '', '\u00e6'])
+        self.assertListEqual(lines_mapped, lines)
+
+    def test_carriage_return_line_endings(self):
+        # Files with only '\r' as line ending are parsed as with '\n'
+        for lines in self.read_both(b'# Comment\rKEY\r1\r\rK2\rA\tB\r\r'):
+            self.assertDictEqual(parse_keywords(remove_empty_lines(lines)), {'key': 1.0, 'k2': ['a', 'b']})
+
+
+class TestParseCache(PiptFileTestCase):
+    """
+    Test the cache of parsed keywords in read_txt().
+    """
+
+    def test_cache_hit(self):
+        # An unchanged file is only parsed once
+        init_file = self.write_pipt(DATAASSIM + FWDSIM)
+        with mock.patch.object(read_config, '_parse_txt', wraps=_parse_txt) as parse:
+            first = read_txt(init_file)
+            second = read_txt(init_file)
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(first[1], second[1])
+
+    def test_cache_invalidation(self):
+        # A changed file is parsed again, and replaces the cache entry for the file
+        init_file = self.write_pipt(DATAASSIM + FWDSIM)
+        read_txt(init_file)
+        self.write_pipt(DATAASSIM + FWDSIM.replace('PARALLEL\n1\n', 'PARALLEL\n10\n'))
+        self.assertEqual(read_txt(init_file)[1]['parallel'], 10.0)
+        self.assertEqual(sum(path == os.path.abspath(init_file) for path in read_config._PARSE_CACHE), 1)
+
+    def test_cache_copies(self):
+        # Modifying the returned dictionaries does not change the cached ones
+        init_file = self.write_pipt(DATAASSIM + FWDSIM)
+        keys_da, keys_fwd = read_txt(init_file)
+        keys_da['truedata'][0][0] = -1.0
+        keys_fwd['reportpoint'].append(3.0)
+        keys_fwd['parallel'] = 2.0
+        keys_da, keys_fwd = read_txt(init_file)
+        self.assertEqual(keys_da['truedata'][0][0], 1.0)
+        self.assertEqual(keys_fwd['reportpoint'], [1.0, 2.0])
+        self.assertEqual(keys_fwd['parallel'], 1.0)
+
+
+class TestMandatoryKeywords(unittest.TestCase):
+    """
+    Test checks for mandatory keywords.
+    """
+
+    def test_ensemble_prior(self):
+        # PRIOR_<STATICVAR> or IMPORTSTATICVAR must be given
+        check_mand_keywords_en({'ne': 10.0, 'state': 'permx', 'prior_permx': []})
+        check_mand_keywords_en({'ne': 10.0, 'state': 'permx', 'importstaticvar': 'permx.npz'})
+        with self.assertRaises(AssertionError):
+            check_mand_keywords_en({'ne': 10.0, 'state': 'permx'})